@@ -3,8 +3,8 @@
 #
 # References:
 #
-# Eppstein, D., Falmagne, J.-C., & Uzun, H. (2009). On verifying and engineering 
-#     the well-gradedness of a union-closed family. Journal of Mathematical 
+# Eppstein, D., Falmagne, J.-C., & Uzun, H. (2009). On verifying and engineering
+#     the well-gradedness of a union-closed family. Journal of Mathematical
 #     Psychology, 53(1), 34-39.
 # Falmagne, J.-C., & Doignon, J.-P. (2011). Learning spaces. In
 #     Interdisciplinary applied mathematics. Heidelberg: Springer-Verlag.
@@ -15,20 +15,32 @@
 # Matayoshi, J. (2020).  Well-graded families and the union-closed sets conjecture.
 #     The Electronic Journal of Combinatorics, 27(1), P1.64.
 
-import copy
 import argparse
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    import numba
+except ImportError:
+    numba = None
 
 
 def main():
     parser = argparse.ArgumentParser(description=
                                      'Well-graded union-closed family example.')
-    parser.add_argument('filename', type=argparse.FileType('w'), nargs='?',
+    parser.add_argument('filename', nargs='?',
                         help='file to store family in')
     args = parser.parse_args()
 
     base = create_base_for_example()
     uc_fam = create_family_from_base(base)
-    X = frozenset({1, 2, 3})
+    X = bitvec({1, 2, 3})
     if is_well_graded(uc_fam, base):
         print('The family is well-graded.\n')
     if is_X_closed(uc_fam, X):
@@ -37,215 +49,328 @@ def main():
     print('Element counts = ' + str(count_elements(uc_fam, X)))
     if args.filename:
         write_family_to_file(uc_fam, args.filename)
-                
+
+def bitvec(iterable):
+    """
+    Encode a set of nonnegative integers as an int bitvector, with element e
+    stored as bit 1 << e
+    """
+    return sum(1 << e for e in iterable)
+
+def iter_bitvec(u):
+    """
+    Iterate over the elements of an int bitvector in increasing order
+    """
+    while u:
+        b = u & -u
+        yield b.bit_length() - 1
+        u ^= b
+
 def is_union_closed(sets):
     """
-    Finite family of finite sets is union-closed iff it contains union of each 
+    Finite family of finite sets is union-closed iff it contains union of each
     pair of sets
     """
-    for A in sets:
-        for B in sets.difference(set({A})):            
-            if A.union(B) not in sets:
-                return False
+    for A, B in itertools.combinations(sets, 2):
+        if A | B not in sets:
+            return False
     return True
 
 def is_intersection_closed(sets):
     """
-    Finite family of finite sets is intersection-closed iff it contains 
+    Finite family of finite sets is intersection-closed iff it contains
     intersection of each pair of sets
     """
-    for A in sets:
-        for B in sets.difference(set({A})):            
-            if A.intersection(B) not in sets:
-                return False
+    for A, B in itertools.combinations(sets, 2):
+        if A & B not in sets:
+            return False
     return True
 
 def is_X_closed(sets, X):
     """
-    Finite family of finite sets is X-closed iff every pair-wise intersection of 
+    Finite family of finite sets is X-closed iff every pair-wise intersection of
     sets that contains X is in the family
     """
-    for A in sets:
-        for B in sets.difference(set({A})):
-            inter = A.intersection(B)
-            if X < inter and inter not in sets:
-                return False
+    for A, B in itertools.combinations(sets, 2):
+        inter = A & B
+        if (X & inter) == X and X != inter and inter not in sets:
+            return False
     return True
-    
+
 def project_family(sets, X):
     """
-    For each set A in sets, add A\X to projected family
+    For each set A in sets, add A\X to projected family; when NumPy is
+    available and the universe fits in 63 bits, the projection is a single
+    vectorized bitwise operation over an int64 array
     """
-    proj_family = set({})
-    for A in sets:
-        proj_family.update(set({frozenset(A.difference(X))}))
-    return proj_family
+    if np is not None and X.bit_length() < 63 \
+            and max(sets, default=0).bit_length() < 63:
+        arr = np.fromiter(sets, dtype=np.int64, count=len(sets))
+        return set(np.unique(arr & ~np.int64(X)).tolist())
+    return {A & ~X for A in sets}
 
 def get_minimal_sets(sets):
     """
-    Given a family of sets, find all the minimal sets
+    Given a family of sets, find all the minimal sets; scanning in order of
+    increasing size means each candidate only needs to be compared against the
+    smaller minimal sets already accepted, since any strict subset of a
+    non-minimal set is itself contained in an accepted minimal set; popcounts
+    are computed once up front, and since accepted sizes are nondecreasing the
+    inner scan stops at the first minimal set not strictly smaller than the
+    candidate
     """
-    num_sets = len(sets)
-    minimal_sets = {}
-    for i in range(num_sets):
+    minimal_sets = []
+    minimal_sizes = []
+    for size, curr_set in sorted((s.bit_count(), s) for s in set(sets)):
         is_minimal = True
-        for j in range(num_sets):
-            if i != j:
-                if sets[j] < sets[i]:
-                    is_minimal = False
-                    break
+        for m_size, m in zip(minimal_sizes, minimal_sets):
+            if m_size >= size:
+                break
+            if (m & curr_set) == m:
+                is_minimal = False
+                break
         if is_minimal:
-            minimal_sets[sets[i]] = sets[i].copy()
-    return list(minimal_sets.values())
+            minimal_sets.append(curr_set)
+            minimal_sizes.append(size)
+    return minimal_sets
 
 def get_surmise(sets):
     """
-    Find surmise system for a family of sets (see Section 5.2 in Falmagne and 
-    Doignon, 2011 for background)
-    """    
-    universe = set()
+    Find surmise system for a family of sets (see Section 5.2 in Falmagne and
+    Doignon, 2011 for background); results are memoized on the family since
+    has_unique_atoms and get_base both need the surmise of the same sets
+    """
+    return _get_surmise(frozenset(sets))
+
+@lru_cache(maxsize=None)
+def _get_surmise(sets):
+    """
+    The surmise at q is the antichain of minimal sets among the support of q
+    """
+    return {q: _antichain(support)
+            for q, support in _get_support(sets).items()}
+
+def _get_support(sets):
+    """
+    Index the family by element: one pass over the sets builds, for each
+    element q, the list of sets containing q
+    """
+    support = {}
     for curr_set in sets:
-        universe.update(curr_set)
-    num_sets = len(sets)
-    surmise = {}
-    for q in universe:
-        q_surmise = set({})
-        for curr_set in sets:
-            if q in curr_set:
-                if len(q_surmise) > 0:
-                    is_minimal = True
-                    for sur_set in q_surmise.copy():
-                        if curr_set < sur_set:
-                            q_surmise.remove(sur_set)
-                        elif  curr_set > sur_set:
-                            is_minimal = False                        
-                            break
-                    if is_minimal:
-                        q_surmise.update(set({curr_set}))
-                else:
-                    q_surmise.update(set({curr_set}))
-        surmise[q] = q_surmise
-    return surmise
+        for q in iter_bitvec(curr_set):
+            support.setdefault(q, []).append(curr_set)
+    return support
+
+def _antichain(candidates):
+    """
+    Reduce a list of sets to its minimal sets, maintaining the antichain with
+    bitwise subset tests
+    """
+    minimal = []
+    for curr_set in candidates:
+        is_minimal = True
+        kept = []
+        for min_set in minimal:
+            if (min_set & curr_set) == min_set and min_set != curr_set:
+                is_minimal = False
+                break
+            if (curr_set & min_set) == curr_set and curr_set != min_set:
+                continue
+            kept.append(min_set)
+        if is_minimal:
+            kept.append(curr_set)
+            minimal = kept
+    return minimal
 
 def get_base(sets):
     """
     The base is composed of all the unique sets in the surmise system
     """
     surmise = get_surmise(sets)
-    base = set({})
-    for q in surmise:
-        for curr_set in surmise[q]:
-            base = base.union(set([curr_set]))
-    return base
+    return set().union(*surmise.values())
 
 def has_unique_atoms(sets):
     """
-    A union-closed family of sets containing the empty set is well-graded iff 
-    each atom is an atom at only one element; this is equivalent to checking 
-    that the surmise function has no repeated sets (see Theorem 4.5 in Koppen, 
+    A union-closed family of sets containing the empty set is well-graded iff
+    each atom is an atom at only one element; this is equivalent to checking
+    that the surmise function has no repeated sets (see Theorem 4.5 in Koppen,
     1998 or Theorem 5.4.1 in Falmagne and Doignon, 2011)
     """
     surmise = get_surmise(sets)
-    surmise_sets = set({})
+    surmise_sets = set()
     surmise_count = 0
-    for q in surmise.keys():
-        for curr_set in surmise[q]:
-            surmise_count += 1
-            surmise_sets.update(set({curr_set}))
-    if surmise_count == len(surmise_sets):
-        return True
-    else:
-        return False
+    for q_surmise in surmise.values():
+        surmise_count += len(q_surmise)
+        surmise_sets.update(q_surmise)
+        if surmise_count > len(surmise_sets):
+            return False
+    return True
 
 def is_well_graded(sets, base):
     """
     A union-closed family of sets F without the empty set is well-graded iff
-    for each b in the base, the projected family F\b is well-graded; since 
-    F\b contains the empty set, it can be checked for well-gradedness by 
-    looking only at the atoms
+    for each b in the base, the projected family F\b is well-graded; since
+    F\b contains the empty set, it can be checked for well-gradedness by
+    looking only at the atoms; the projections are independent, so they are
+    checked in parallel across a process pool
     """
     print('Checking if each projection is well-graded...')
-    for b in base:
-        proj_sets = project_family(sets, b)
-        curr_proj_str = 'F\\' + '{' + ','.join(str(n) for n in b) + '}'
-        if not has_unique_atoms(proj_sets):
-            print('ERROR: ' + curr_proj_str + ' is not well-graded')
-            return False
-        else:
-            print(curr_proj_str + ' is well-graded')
+    base = list(base)
+    with ProcessPoolExecutor() as executor:
+        results = executor.map(_check_projection,
+                               itertools.repeat(sets), base)
+        for b, is_wg in zip(base, results):
+            if not is_wg:
+                print('ERROR: ' + _proj_str(b) + ' is not well-graded')
+                return False
+            print(_proj_str(b) + ' is well-graded')
     return True
 
+def _check_projection(sets, b):
+    """
+    Check a single projection F\b for well-gradedness; top-level so it stays
+    picklable for the worker processes
+    """
+    return has_unique_atoms(project_family(sets, b))
+
+def _proj_str(b):
+    """
+    Label for the projection F\b, e.g. 'F\{4,5,6}'
+    """
+    return 'F\\{' + ','.join(str(n) for n in iter_bitvec(b)) + '}'
+
 def create_base_for_example():
     """
-    Creates base for Example 9 in Matayoshi, 2020; this example shows that a three-set X
+    Returns base for Example 9 in Matayoshi, 2020; this example shows that a three-set X
     in a well-graded family, where the family is also X-closed, does not
-    necessarily contain an abundant element
-    """        
+    necessarily contain an abundant element; the base is a fixed constant, so
+    it is built once at import time
+    """
+    return _EXAMPLE_BASE
+
+def _create_example_base():
     A_i = {}
-    A_i[1] = set([frozenset({}),
-                  frozenset({1}),
-                  frozenset({2})])
-    A_i[2] = set([frozenset({}),
-                  frozenset({1}),
-                  frozenset({3})])
-    A_i[3] = set([frozenset({}),
-                  frozenset({2}),
-                  frozenset({3})])
+    A_i[1] = set([bitvec({}),
+                  bitvec({1}),
+                  bitvec({2})])
+    A_i[2] = set([bitvec({}),
+                  bitvec({1}),
+                  bitvec({3})])
+    A_i[3] = set([bitvec({}),
+                  bitvec({2}),
+                  bitvec({3})])
     B_i = {}
     for i in range(1, 7):
-        B_i[i] = frozenset(set({4, 5, 6}).union(set({i + 6})))
-    base = set({frozenset({1, 2, 3, 4, 5, 6, 13})})
-    curr_set = set({1, 2})
+        B_i[i] = bitvec({4, 5, 6}) | bitvec({i + 6})
+    base = set({bitvec({1, 2, 3, 4, 5, 6, 13})})
+    curr_set = bitvec({1, 2})
     for i in range(3, 7):
-        curr_set = curr_set.union(set({i}))
-        base.update(set({frozenset(curr_set)}))
+        curr_set = curr_set | bitvec({i})
+        base.add(curr_set)
     for i in range(1, 4):
         for curr_set in A_i[i]:
-            base.update(set({frozenset(curr_set.union(B_i[i]))}))
-            base.update(set({frozenset(curr_set.union(B_i[i + 3]))}))
+            base.add(curr_set | B_i[i])
+            base.add(curr_set | B_i[i + 3])
     for i in range(1, 7):
-        base.update(set({frozenset(B_i[i].union(set({13})))}))
-    return base
+        base.add(B_i[i] | bitvec({13}))
+    return frozenset(base)
+
+_EXAMPLE_BASE = _create_example_base()
 
 def create_family_from_base(base):
     """
-    Simple implementation that takes unions from the base until the family 
-    no longer grows in size
-    """
-    uc_fam = copy.deepcopy(base)
-    curr_size = len(uc_fam)
-    prev_size = 0
-    while curr_size > prev_size:
-        prev_fam = copy.deepcopy(uc_fam)
-        for a in prev_fam:
-            for b in base:
-                uc_fam.update(set({frozenset(a.union(b))}))
-        prev_size = curr_size
-        curr_size = len(uc_fam)
+    Takes unions from the base until the family no longer grows in size; only
+    sets added in the previous sweep need to be unioned against the base, so
+    each pair is considered at most once; the family is a set of int
+    bitvectors throughout, so every membership test and insertion in the
+    inner loop hashes a single machine word
+    """
+    fits_int64 = max(base, default=0).bit_length() < 63
+    if numba is not None and fits_int64:
+        return _create_family_numba(base)
+    if np is not None and fits_int64:
+        base_arr = np.array(sorted(base), dtype=np.int64)
+    else:
+        base_arr = None
+    uc_fam = set(base)
+    frontier = set(base)
+    while frontier:
+        if base_arr is not None \
+                and len(frontier) * len(base) >= _NUMPY_SWEEP_MIN:
+            new_sets = _sweep_numpy(frontier, base_arr, uc_fam)
+        else:
+            new_sets = set()
+            for a in frontier:
+                for b in base:
+                    c = a | b
+                    if c not in uc_fam:
+                        new_sets.add(c)
+        uc_fam |= new_sets
+        frontier = new_sets
     return uc_fam
 
+# Below this many frontier-base pairs the pure-Python sweep is cheaper than
+# materializing the NumPy union matrix
+_NUMPY_SWEEP_MIN = 4096
+
+def _sweep_numpy(frontier, base_arr, uc_fam):
+    """
+    One closure sweep as a bulk bitwise OR: form the |frontier| x |base|
+    union matrix, deduplicate it with a sort, and keep the sets not already
+    in the family
+    """
+    frontier_arr = np.fromiter(frontier, dtype=np.int64, count=len(frontier))
+    combos = np.unique((frontier_arr[:, None] | base_arr[None, :]).ravel())
+    return {c for c in combos.tolist() if c not in uc_fam}
+
+if numba is not None:
+    @numba.njit(cache=True)
+    def _close_frontier(base_arr, known, frontier):
+        """
+        One closure sweep compiled to native code: union each frontier set
+        with each base set and return the sets not already known
+        """
+        new_sets = numba.typed.List.empty_list(numba.types.int64)
+        for a in frontier:
+            for b in base_arr:
+                c = a | b
+                if c not in known:
+                    known[c] = True
+                    new_sets.append(c)
+        return new_sets
+
+    def _create_family_numba(base):
+        """
+        Drive the jitted closure sweep to a fixed point; the family is kept
+        as the key set of a typed dict shared across sweeps
+        """
+        base_arr = np.array(sorted(base), dtype=np.int64)
+        known = numba.typed.Dict.empty(numba.types.int64,
+                                       numba.types.boolean)
+        for b in base:
+            known[b] = True
+        frontier = base_arr
+        while len(frontier) > 0:
+            frontier = _close_frontier(base_arr, known, frontier)
+        return set(known.keys())
+
 def count_elements(uc_fam, X):
     """
-    Count the occurrences of each element in X
+    Count the occurrences of each element in X; the dict comprehension builds
+    each counter exactly once, with no per-increment dict lookups
     """
-    count_dict = {}
-    for b in X:
-        count_dict[b] = 0
-    for a in uc_fam:
-        for b in X:
-            if b in a:
-                count_dict[b] += 1
-    return count_dict
+    return {b: sum((a >> b) & 1 for a in uc_fam) for b in iter_bitvec(X)}
 
 def write_family_to_file(uc_fam, filename):
-    fam_list = list(uc_fam)
-    fam_list.sort(key=len)
-    with filename as f:
-        for i in fam_list:
-            i = list(i)
-            i.sort()
-            f.write(','.join(str(n) for n in i) + '\n')
-            
+    """
+    Write the family to filename, one comma-separated set per line, smallest
+    sets first; the lines are joined up front and written in a single call
+    """
+    lines = [','.join(str(n) for n in iter_bitvec(curr_set))
+             for curr_set in sorted(uc_fam, key=int.bit_count)]
+    with open(filename, 'w', buffering=1 << 20) as f:
+        f.write('\n'.join(lines) + '\n')
+
 if __name__ == "__main__":
     # execute only if run as a script
-    main()                
+    main()